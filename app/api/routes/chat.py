@@ -1,3 +1,4 @@
+from anyio import from_thread
 from fastapi import APIRouter, Depends, Query, status, HTTPException
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
@@ -13,7 +14,7 @@ from ...schemas.chat import (
     ModelConfig,
     ChatServiceCreateResponse,
 )
-from ...services.rag.factory import rag_chat
+from ...services.rag.factory import rag_chat, invalidate_chat_service
 from ...models.user import User
 from ...models.history import History
 from ..deps import get_current_user
@@ -68,6 +69,7 @@ def create_chat_service(
     svc = ChatService(
         service_id=req.service_id,
         chat_deployment=req.chat_deployment,
+        pool=req.pool,
     )
     db.add(svc)
     try:
@@ -76,4 +78,6 @@ def create_chat_service(
         db.rollback()
         raise HTTPException(status_code=409, detail="service_id already exists")
     db.refresh(svc)
+    # Sync route runs in the threadpool; hop back to the loop to notify other workers
+    from_thread.run(invalidate_chat_service, svc.service_id, svc.pool)
     return ChatServiceCreateResponse(created=True)
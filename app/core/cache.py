@@ -0,0 +1,413 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Generic,
+    Optional,
+    Protocol,
+    Set,
+    Tuple,
+    TypeVar,
+)
+
+V = TypeVar("V")
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "rag:cache:invalidate"
+
+
+class SharedStore(Protocol):
+    async def get(self, key: str) -> Optional[str]: ...
+
+    async def set(self, key: str, value: str, ex: Optional[int] = None) -> None: ...
+
+    async def delete(self, *keys: str) -> None: ...
+
+    async def incr(self, key: str) -> int: ...
+
+    async def publish(self, channel: str, message: str) -> None: ...
+
+    def subscribe(
+        self, channel: str, on_subscribed: Optional[Callable[[], None]] = None
+    ) -> AsyncIterator[str]: ...
+
+
+class InMemoryStore:
+    """In-process stand-in for Redis (single worker and tests)."""
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[Optional[float], str]] = {}
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+
+    async def get(self, key: str) -> Optional[str]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at is not None and expires_at <= time.monotonic():
+            self._data.pop(key, None)
+            return None
+        return value
+
+    async def set(self, key: str, value: str, ex: Optional[int] = None) -> None:
+        expires_at = time.monotonic() + ex if ex else None
+        self._data[key] = (expires_at, value)
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            self._data.pop(key, None)
+
+    async def incr(self, key: str) -> int:
+        value = int(await self.get(key) or 0) + 1
+        self._data[key] = (None, str(value))
+        return value
+
+    async def publish(self, channel: str, message: str) -> None:
+        for queue in list(self._subscribers[channel]):
+            queue.put_nowait(message)
+
+    async def subscribe(
+        self, channel: str, on_subscribed: Optional[Callable[[], None]] = None
+    ) -> AsyncIterator[str]:
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers[channel].add(queue)
+        if on_subscribed is not None:
+            on_subscribed()
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._subscribers[channel].discard(queue)
+
+
+class RedisStore:
+    """Adapter over a `redis.asyncio` client (or `fakeredis.aioredis`)."""
+
+    def __init__(self, client: Any):
+        self._client = client
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self._client.get(key)
+
+    async def set(self, key: str, value: str, ex: Optional[int] = None) -> None:
+        await self._client.set(key, value, ex=ex)
+
+    async def delete(self, *keys: str) -> None:
+        if keys:
+            await self._client.delete(*keys)
+
+    async def incr(self, key: str) -> int:
+        return await self._client.incr(key)
+
+    async def publish(self, channel: str, message: str) -> None:
+        await self._client.publish(channel, message)
+
+    async def subscribe(
+        self, channel: str, on_subscribed: Optional[Callable[[], None]] = None
+    ) -> AsyncIterator[str]:
+        pubsub = self._client.pubsub()
+        await pubsub.subscribe(channel)
+        try:
+            async for msg in pubsub.listen():
+                # The server confirms SUBSCRIBE before delivering anything, and
+                # again after redis-py transparently reconnects
+                if msg.get("type") == "subscribe" and on_subscribed is not None:
+                    on_subscribed()
+                elif msg.get("type") == "message":
+                    yield msg["data"]
+        finally:
+            await pubsub.unsubscribe(channel)
+            await pubsub.aclose()
+
+
+def create_store_from_env() -> SharedStore:
+    url = os.getenv("REDIS_URL", "").strip()
+    if not url:
+        return InMemoryStore()
+    import redis.asyncio as redis  # only required when REDIS_URL is set
+
+    return RedisStore(redis.from_url(url, decode_responses=True))
+
+
+class LocalLRU(Generic[V]):
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._data: OrderedDict[str, Tuple[float, V]] = OrderedDict()
+
+    def get(self, key: str) -> Optional[V]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        stored_at, value = item
+        if self._ttl is not None and time.monotonic() - stored_at > self._ttl:
+            self._data.pop(key, None)
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: V) -> None:
+        self._data[key] = (time.monotonic(), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self._maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+class CacheBus:
+    """Shared store plus the pub/sub channel that keeps worker-local tiers coherent."""
+
+    def __init__(
+        self,
+        store: SharedStore,
+        channel: str = INVALIDATION_CHANNEL,
+        subscribe_timeout_sec: float = 5.0,
+        retry_delay_sec: float = 1.0,
+    ):
+        self.store = store
+        self.channel = channel
+        self._subscribe_timeout = subscribe_timeout_sec
+        self._retry_delay = retry_delay_sec
+        self.worker_id = uuid.uuid4().hex
+        self._caches: Dict[str, "TwoTierCache"] = {}
+        self._listener: Optional[asyncio.Task] = None
+        self._subscribed = asyncio.Event()
+
+    def register(self, cache: "TwoTierCache") -> None:
+        if cache.namespace in self._caches:
+            raise ValueError(f"Cache namespace {cache.namespace} already registered")
+        self._caches[cache.namespace] = cache
+
+    async def publish(self, namespace: str, key: str) -> None:
+        message = json.dumps({"origin": self.worker_id, "ns": namespace, "key": key})
+        try:
+            await self.store.publish(self.channel, message)
+        except Exception:
+            logger.warning(
+                "Cache invalidation publish failed for %s:%s",
+                namespace,
+                key,
+                exc_info=True,
+            )
+
+    def handle(self, message: str) -> None:
+        try:
+            data = json.loads(message)
+        except ValueError:
+            return
+        if data.get("origin") == self.worker_id:
+            return
+        cache = self._caches.get(data.get("ns"))
+        if cache is not None:
+            cache.evict_local(str(data.get("key")))
+
+    def clear_local(self) -> None:
+        for cache in self._caches.values():
+            cache.clear_local()
+
+    async def start(self) -> None:
+        if self._listener is not None:
+            return
+        self._subscribed = asyncio.Event()
+        self._listener = asyncio.create_task(self._listen())
+        # Don't serve traffic until invalidations can actually reach us
+        try:
+            await asyncio.wait_for(
+                self._subscribed.wait(), timeout=self._subscribe_timeout
+            )
+        except asyncio.TimeoutError:
+            logger.warning(
+                "Cache invalidation subscription not confirmed after %.1fs",
+                self._subscribe_timeout,
+            )
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    def _on_subscribed(self) -> None:
+        # Anything cached locally before this point (including while we were
+        # disconnected) may have missed invalidations
+        self.clear_local()
+        self._subscribed.set()
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                async for message in self.store.subscribe(
+                    self.channel, self._on_subscribed
+                ):
+                    self.handle(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning("Cache invalidation subscription lost", exc_info=True)
+                self.clear_local()
+                await asyncio.sleep(self._retry_delay)
+
+
+def _identity(value: Any) -> Any:
+    return value
+
+
+class TwoTierCache(Generic[V]):
+    """Worker-local LRU in front of the shared store.
+
+    `shared=False` keeps values local only (e.g. live client objects) while
+    still honouring invalidations published by other workers.
+    """
+
+    def __init__(
+        self,
+        bus: CacheBus,
+        namespace: str,
+        *,
+        maxsize: int = 1024,
+        ttl: Optional[int] = None,
+        shared: bool = True,
+        dumps: Callable[[Any], str] = json.dumps,
+        loads: Callable[[str], Any] = json.loads,
+    ):
+        self.namespace = namespace
+        self._bus = bus
+        self._ttl = ttl
+        self._shared = shared
+        self._dumps = dumps if shared else _identity
+        self._loads = loads if shared else _identity
+        self._local: LocalLRU[V] = LocalLRU(maxsize=maxsize, ttl=ttl)
+        bus.register(self)
+
+    def _shared_key(self, key: str) -> str:
+        return f"rag:{self.namespace}:{key}"
+
+    def _version_key(self, key: str) -> str:
+        return f"rag:{self.namespace}:{key}:version"
+
+    def get_local(self, key: Any) -> Optional[V]:
+        return self._local.get(str(key))
+
+    def set_local(self, key: Any, value: V) -> None:
+        self._local.set(str(key), value)
+
+    def evict_local(self, key: Any) -> None:
+        self._local.pop(str(key))
+
+    def clear_local(self) -> None:
+        self._local.clear()
+
+    # The shared tier is an optimisation: store errors are logged and treated
+    # as misses / skipped writes so an outage falls back to the DB
+    async def get_shared(self, key: Any) -> Any:
+        if not self._shared:
+            return None
+        try:
+            raw = await self._bus.store.get(self._shared_key(str(key)))
+        except Exception:
+            logger.warning(
+                "Shared cache read failed for %s:%s",
+                self.namespace,
+                key,
+                exc_info=True,
+            )
+            return None
+        return None if raw is None else self._loads(raw)
+
+    async def set_shared(self, key: Any, value: Any) -> None:
+        if not self._shared:
+            return
+        try:
+            await self._bus.store.set(
+                self._shared_key(str(key)), self._dumps(value), ex=self._ttl
+            )
+        except Exception:
+            logger.warning(
+                "Shared cache write failed for %s:%s",
+                self.namespace,
+                key,
+                exc_info=True,
+            )
+
+    async def get(self, key: Any) -> Optional[V]:
+        value = self.get_local(key)
+        if value is not None:
+            return value
+        value = await self.get_shared(key)
+        if value is not None:
+            self.set_local(key, value)
+        return value
+
+    async def set(self, key: Any, value: V) -> None:
+        self.set_local(key, value)
+        await self.set_shared(key, value)
+
+    async def version(self, key: Any) -> Optional[int]:
+        """Current write version of `key`; None if the shared store is unavailable."""
+        if not self._shared:
+            return None
+        try:
+            return int(await self._bus.store.get(self._version_key(str(key))) or 0)
+        except Exception:
+            logger.warning(
+                "Shared cache version read failed for %s:%s",
+                self.namespace,
+                key,
+                exc_info=True,
+            )
+            return None
+
+    async def bump_version(self, key: Any) -> Optional[int]:
+        if not self._shared:
+            return None
+        try:
+            return await self._bus.store.incr(self._version_key(str(key)))
+        except Exception:
+            logger.warning(
+                "Shared cache version bump failed for %s:%s",
+                self.namespace,
+                key,
+                exc_info=True,
+            )
+            return None
+
+    async def notify(self, key: Any) -> None:
+        """Tell other workers to drop their local copy of `key`."""
+        await self._bus.publish(self.namespace, str(key))
+
+    async def invalidate(self, key: Any) -> None:
+        key = str(key)
+        self.evict_local(key)
+        if self._shared:
+            try:
+                await self._bus.store.delete(self._shared_key(key))
+            except Exception:
+                logger.warning(
+                    "Shared cache delete failed for %s:%s",
+                    self.namespace,
+                    key,
+                    exc_info=True,
+                )
+        await self.notify(key)
+
+
+cache_bus = CacheBus(create_store_from_env())
@@ -1,16 +1,49 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.responses import ORJSONResponse
 from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy import inspect, text
 import os
 from .core import config as _config  # ensure .env is loaded before anything else
 from .core.database import Base, engine
+from .core.cache import cache_bus
 from .api.routes.auth import router as auth_router
 from .api.routes.chat import router as chat_router
 
 Base.metadata.create_all(bind=engine)
 
-app = FastAPI(default_response_class=ORJSONResponse)
+
+def _migrate_chat_services_pool() -> None:
+	# create_all doesn't add columns to existing tables; databases created
+	# before deployment pools need `pool` added in place
+	columns = {c["name"] for c in inspect(engine).get_columns("chat_services")}
+	if "pool" in columns:
+		return
+	with engine.begin() as conn:
+		conn.execute(text("ALTER TABLE chat_services ADD COLUMN pool VARCHAR"))
+		conn.execute(
+			text(
+				"CREATE INDEX IF NOT EXISTS ix_chat_services_pool "
+				"ON chat_services (pool)"
+			)
+		)
+
+
+_migrate_chat_services_pool()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+	# Subscribe to cache invalidations published by other workers
+	await cache_bus.start()
+	try:
+		yield
+	finally:
+		await cache_bus.stop()
+
+
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
 app.add_middleware(GZipMiddleware, minimum_size=500)
 
 # CORS configuration (set CORS_ORIGINS in .env as comma-separated list or "*")
@@ -7,3 +7,4 @@ class ChatService(Base):
     id = Column(Integer, primary_key=True, index=True)
     service_id = Column(String, unique=True, index=True, nullable=False)  
     chat_deployment = Column(String, nullable=False)
+    pool = Column(String, index=True, nullable=True)
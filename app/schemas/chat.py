@@ -18,6 +18,7 @@ class ChatRequest(BaseModel):
 class ModelConfig(BaseModel):
     service_id: str
     chat_deployment: str
+    pool: str | None = None
 
 
 class EmbeddingConfig(BaseModel):
@@ -2,6 +2,7 @@ from .vector_retriever import VectorSearchRetriever
 from .chat_history_service import ChatHistoryService
 from .plugins import VectorSearchPlugin
 from .chat_service import create_chat_service
+from .deployment_router import DeploymentRouter
 from .factory import rag_chat
 from .service_config import load_azure_config_from_env
 
@@ -10,6 +11,7 @@ __all__ = [
     "ChatHistoryService",
     "VectorSearchPlugin",
     "create_chat_service",
+    "DeploymentRouter",
     "rag_chat",
     "load_azure_config_from_env",
 ]
@@ -1,11 +1,12 @@
 from __future__ import annotations
 
 import re, asyncio
-from typing import Dict, List
+from typing import List
 from sqlalchemy.orm import Session
 
 from ...models import History
 from ...core.database import SessionLocal
+from ...core.cache import TwoTierCache, cache_bus
 
 from semantic_kernel.contents.utils.author_role import AuthorRole
 from semantic_kernel.contents import ChatHistoryTruncationReducer
@@ -23,7 +24,15 @@ def redact(text: str) -> str:
 
 # --------- Cache ----------
 MAX_TURN = 8
-_CACHED_HISTORY: Dict[int, ChatHistoryTruncationReducer] = {}
+_HISTORY_TTL_SEC = 600
+# Local tier holds live reducers; the shared tier holds
+# {"version": n, "pairs": [[question, answer], ...]} with redacted text.
+# The per-user version is a seqlock: persist bumps it before the DB write
+# (odd = write in flight) and again after. Snapshots are only cached when
+# the version was even and unchanged across the DB read.
+_CACHED_HISTORY: TwoTierCache[ChatHistoryTruncationReducer] = TwoTierCache(
+    cache_bus, "history", maxsize=1024, ttl=_HISTORY_TTL_SEC
+)
 
 SYSTEM_MESSAGE = """
 You are a RAG assistant.
@@ -47,10 +56,35 @@ Output:
 
 class ChatHistoryService:
     async def build_context(self, db: Session, user_id: int, limit: int = MAX_TURN):
-        ch = _CACHED_HISTORY.get(user_id)
+        ch = _CACHED_HISTORY.get_local(user_id)
         if ch:
             return ch
 
+        version = await _CACHED_HISTORY.version(user_id)
+        stable = version is None or version % 2 == 0
+        pairs: List[List[str]] | None = None
+        if stable and version is not None:
+            entry = await _CACHED_HISTORY.get_shared(user_id)
+            if entry and entry.get("version") == version:
+                pairs = entry["pairs"]
+
+        cacheable = stable
+        if pairs is None:
+            rows: List[History] = (
+                db.query(History)
+                .filter(History.user_id == user_id)
+                .order_by(History.timestamp.desc())
+                .limit(limit)
+                .all()
+            )
+            rows.reverse()
+            pairs = [[redact(r.question or ""), redact(r.answer or "")] for r in rows]
+            cacheable = stable and await _CACHED_HISTORY.version(user_id) == version
+            if cacheable and version is not None:
+                await _CACHED_HISTORY.set_shared(
+                    user_id, {"version": version, "pairs": pairs}
+                )
+
         reducer = ChatHistoryTruncationReducer(
             target_count=limit, threshold_count=6, auto_reduce=True
         )
@@ -58,28 +92,16 @@ class ChatHistoryService:
             ChatMessageContent(role=AuthorRole.SYSTEM, content=SYSTEM_MESSAGE)
         )
 
-        rows: List[History] = (
-            db.query(History)
-            .filter(History.user_id == user_id)
-            .order_by(History.timestamp.desc())
-            .limit(limit)
-            .all()
-        )
-        rows.reverse()
-
-        for r in rows:
+        for question, answer in pairs[-limit:]:
             await reducer.add_message_async(
-                ChatMessageContent(
-                    role=AuthorRole.USER, content=redact(r.question or "")
-                )
+                ChatMessageContent(role=AuthorRole.USER, content=question)
             )
             await reducer.add_message_async(
-                ChatMessageContent(
-                    role=AuthorRole.ASSISTANT, content=redact(r.answer or "")
-                )
+                ChatMessageContent(role=AuthorRole.ASSISTANT, content=answer)
             )
 
-        _CACHED_HISTORY[user_id] = reducer
+        if cacheable:
+            _CACHED_HISTORY.set_local(user_id, reducer)
         return reducer
 
     async def persist_pair(self, user_id: int, question: str, answer: str) -> None:
@@ -90,10 +112,14 @@ class ChatHistoryService:
             finally:
                 session.close()
 
-        session = SessionLocal()
-        await asyncio.to_thread(_write, session, user_id, question, answer)
+        started = await _CACHED_HISTORY.bump_version(user_id)  # odd: in flight
+        try:
+            session = SessionLocal()
+            await asyncio.to_thread(_write, session, user_id, question, answer)
+        finally:
+            finished = await _CACHED_HISTORY.bump_version(user_id)  # even: done
 
-        ch = _CACHED_HISTORY.get(user_id)
+        ch = _CACHED_HISTORY.get_local(user_id)
         if ch:
             await ch.add_message_async(
                 ChatMessageContent(role=AuthorRole.USER, content=redact(question or ""))
@@ -103,3 +129,18 @@ class ChatHistoryService:
                     role=AuthorRole.ASSISTANT, content=redact(answer or "")
                 )
             )
+
+        # Write through only onto the snapshot taken just before this write,
+        # and only if no other write interleaved; anything else is left with
+        # an old version for readers to ignore and rebuild from the DB
+        if started is not None and finished == started + 1:
+            entry = await _CACHED_HISTORY.get_shared(user_id)
+            if entry and entry.get("version") == started - 1:
+                pair = [redact(question or ""), redact(answer or "")]
+                pairs = entry["pairs"] + [pair]
+                await _CACHED_HISTORY.set_shared(
+                    user_id, {"version": finished, "pairs": pairs[-MAX_TURN:]}
+                )
+
+        # Our reducer is already up to date; other workers drop theirs
+        await _CACHED_HISTORY.notify(user_id)
@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Mapping, TypeVar
+
+import httpx
+from openai import APIConnectionError
+
+T = TypeVar("T")
+C = TypeVar("C")
+
+# Status codes that mean "try another deployment" rather than "the request is bad"
+_RETRYABLE_STATUS = {408, 429}
+# Dropped connections and timeouts carry no status but are worth failing over
+_TRANSPORT_ERRORS = (
+    APIConnectionError,
+    httpx.TransportError,
+    ConnectionError,
+    TimeoutError,
+)
+_MIN_LATENCY_SEC = 1e-3
+
+
+def _retrieve_exception(task: asyncio.Task) -> None:
+    # Mark failures as seen so asyncio doesn't log "exception was never retrieved"
+    if not task.cancelled():
+        task.exception()
+
+
+def is_retryable(exc: BaseException) -> bool:
+    # SK wraps the openai error, so walk the cause chain
+    seen: set[int] = set()
+    cur: BaseException | None = exc
+    while cur is not None and id(cur) not in seen:
+        seen.add(id(cur))
+        if isinstance(cur, _TRANSPORT_ERRORS):
+            return True
+        code = getattr(cur, "status_code", None)
+        if code is None:
+            code = getattr(getattr(cur, "response", None), "status_code", None)
+        if isinstance(code, int):
+            return code in _RETRYABLE_STATUS or code >= 500
+        cur = cur.__cause__ or cur.__context__
+    return False
+
+
+class DeploymentStats:
+    def __init__(self, *, alpha: float, window: int):
+        self._alpha = alpha
+        self.ewma: float | None = None
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.cooldown_until = 0.0
+
+    def record(self, latency: float) -> None:
+        self.samples.append(latency)
+        if self.ewma is None:
+            self.ewma = latency
+        else:
+            self.ewma = self._alpha * latency + (1 - self._alpha) * self.ewma
+
+    def record_censored(self, elapsed: float) -> None:
+        # Cancelled or slow-failing attempt: the true latency is at least
+        # `elapsed`, so it may only pull the estimate up
+        if self.ewma is None or elapsed > self.ewma:
+            self.record(elapsed)
+
+    def p95(self) -> float | None:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[max(0, math.ceil(0.95 * len(ordered)) - 1)]
+
+
+class DeploymentRouter:
+    """Routes a completion across a pool of deployments.
+
+    The primary is picked by EWMA-weighted random choice. If it has not
+    answered within its adaptive p95 deadline a hedged request goes to the
+    next deployment and the slower one is cancelled. 429/5xx responses and
+    transport errors put the deployment in cooldown and fail over to the next
+    one; other errors are raised once no attempt is still in flight.
+    """
+
+    def __init__(
+        self,
+        *,
+        ewma_alpha: float = 0.2,
+        window: int = 64,
+        min_samples: int = 8,
+        initial_deadline_sec: float = 2.0,
+        min_deadline_sec: float = 0.25,
+        max_deadline_sec: float = 10.0,
+        cooldown_sec: float = 5.0,
+        max_hedges: int = 1,
+        cancel_grace_sec: float = 0.1,
+        rng: random.Random | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._alpha = ewma_alpha
+        self._window = window
+        self._min_samples = min_samples
+        self._initial_deadline = initial_deadline_sec
+        self._min_deadline = min_deadline_sec
+        self._max_deadline = max_deadline_sec
+        self._cooldown = cooldown_sec
+        self._max_hedges = max_hedges
+        self._cancel_grace = cancel_grace_sec
+        self._rng = rng or random.Random()
+        self._clock = clock
+        self._stats: Dict[str, DeploymentStats] = {}
+
+    def stats(self, deployment_id: str) -> DeploymentStats:
+        st = self._stats.get(deployment_id)
+        if st is None:
+            st = DeploymentStats(alpha=self._alpha, window=self._window)
+            self._stats[deployment_id] = st
+        return st
+
+    def hedge_deadline(self, deployment_id: str) -> float:
+        st = self.stats(deployment_id)
+        if len(st.samples) < self._min_samples:
+            return self._initial_deadline
+        return min(self._max_deadline, max(self._min_deadline, st.p95()))
+
+    def order(self, deployment_ids: List[str]) -> List[str]:
+        now = self._clock()
+        healthy = [d for d in deployment_ids if self.stats(d).cooldown_until <= now]
+        cooling = [d for d in deployment_ids if d not in healthy]
+        cooling.sort(key=lambda d: self.stats(d).cooldown_until)
+
+        ordered: List[str] = []
+        while healthy:
+            # Never-tried deployments get the best known latency so they are explored
+            ewmas = [self.stats(d).ewma for d in healthy]
+            known = [e for e in ewmas if e is not None]
+            default = min(known) if known else 1.0
+            weights = [
+                1.0 / max(_MIN_LATENCY_SEC, default if e is None else e) for e in ewmas
+            ]
+            pick = self._rng.choices(range(len(healthy)), weights=weights)[0]
+            ordered.append(healthy.pop(pick))
+        return ordered + cooling
+
+    async def complete(
+        self,
+        deployments: Mapping[str, C],
+        call: Callable[[C], Awaitable[T]],
+    ) -> T:
+        if not deployments:
+            raise ValueError("No chat deployments available")
+
+        queue = iter(self.order(list(deployments)))
+        pending: Dict[asyncio.Task, str] = {}
+        started: Dict[str, float] = {}
+        hedges = 0
+        last_exc: BaseException | None = None
+        fatal_exc: BaseException | None = None
+
+        async def _attempt(dep_id: str) -> T:
+            try:
+                result = await call(deployments[dep_id])
+            except asyncio.CancelledError:
+                self.stats(dep_id).record_censored(self._clock() - started[dep_id])
+                raise
+            except Exception:
+                # A fast 429/5xx says nothing about latency and would make a
+                # throttling deployment look like the quickest one
+                elapsed = self._clock() - started[dep_id]
+                if elapsed >= self.hedge_deadline(dep_id):
+                    self.stats(dep_id).record_censored(elapsed)
+                raise
+            self.stats(dep_id).record(self._clock() - started[dep_id])
+            return result
+
+        def _launch() -> bool:
+            dep_id = next(queue, None)
+            if dep_id is None:
+                return False
+            started[dep_id] = self._clock()
+            task = asyncio.ensure_future(_attempt(dep_id))
+            task.add_done_callback(_retrieve_exception)
+            pending[task] = dep_id
+            return True
+
+        async def _cancel_pending() -> None:
+            for task in pending:
+                task.cancel()
+            if pending:
+                # Let losers record their censored latency before we return
+                await asyncio.wait(list(pending), timeout=self._cancel_grace)
+
+        _launch()
+        try:
+            while pending:
+                timeout = None
+                if hedges < self._max_hedges and len(pending) == 1:
+                    dep_id = next(iter(pending.values()))
+                    deadline = started[dep_id] + self.hedge_deadline(dep_id)
+                    timeout = max(0.0, deadline - self._clock())
+
+                done, _ = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # Primary is past its deadline; hedge if there is anyone left
+                    if not _launch():
+                        hedges = self._max_hedges
+                    hedges += 1
+                    continue
+
+                # Look at every finished task before returning so that a
+                # failure finishing alongside the winner still updates stats
+                winner: asyncio.Task | None = None
+                for task in done:
+                    dep_id = pending.pop(task)
+                    if task.cancelled():
+                        continue
+                    exc = task.exception()
+                    if exc is None:
+                        winner = winner or task
+                    elif is_retryable(exc):
+                        self.stats(dep_id).cooldown_until = (
+                            self._clock() + self._cooldown
+                        )
+                        last_exc = exc
+                    elif fatal_exc is None:
+                        # Another attempt may still succeed; stop starting new ones
+                        fatal_exc = exc
+                        hedges = self._max_hedges
+
+                if winner is not None:
+                    return winner.result()
+                if not pending and fatal_exc is None:
+                    _launch()
+        finally:
+            await _cancel_pending()
+
+        exc = fatal_exc or last_exc
+        assert exc is not None
+        raise exc
@@ -2,8 +2,9 @@ from __future__ import annotations
 
 import os
 import asyncio
+import json
 import time
-from typing import Tuple, Dict
+from typing import Tuple, Dict, List
 
 from sqlalchemy.orm import Session
 import semantic_kernel as sk
@@ -12,20 +13,36 @@ import semantic_kernel as sk
 from semantic_kernel.connectors.ai.open_ai import AzureChatPromptExecutionSettings
 from semantic_kernel.connectors.ai import FunctionChoiceBehavior
 
+from ...core.cache import TwoTierCache, cache_bus
 from ...schemas.chat import AzureConfig, ModelConfig, ServiceBundle, EmbeddingConfig
 from .vector_retriever import VectorSearchRetriever
 from .chat_history_service import ChatHistoryService
 from .plugins import VectorSearchPlugin
 from .service_config import load_azure_config_from_env, load_embedding_config_from_env
-from .service_registry import load_model_cfg
+from .service_registry import load_model_cfg, load_pool_cfgs
 from .chat_service import create_chat_service
-
-
-_CACHED_CHAT_SERVICES: Dict[str, ServiceBundle] = {}
-
-_CACHED_MODEL_CONFIG: Dict[str, ModelConfig] = {}
-_CHAT_ANSWER_CACHE: Dict[str, tuple[float, str]] = {}
-_CHAT_CACHE_TTL_SEC = 45
+from .deployment_router import DeploymentRouter
+
+
+# Live clients can't be shared, so this tier is worker-local but still invalidated
+_CACHED_CHAT_SERVICES: TwoTierCache[ServiceBundle] = TwoTierCache(
+    cache_bus, "chat_service", maxsize=64, shared=False
+)
+
+_CACHED_MODEL_CONFIG: TwoTierCache[ModelConfig] = TwoTierCache(
+    cache_bus,
+    "model_config",
+    maxsize=256,
+    dumps=lambda cfg: cfg.model_dump_json(),
+    loads=ModelConfig.model_validate_json,
+)
+_CACHED_POOLS: TwoTierCache[List[ModelConfig]] = TwoTierCache(
+    cache_bus,
+    "pool",
+    maxsize=256,
+    dumps=lambda cfgs: json.dumps([cfg.model_dump() for cfg in cfgs]),
+    loads=lambda raw: [ModelConfig(**d) for d in json.loads(raw)],
+)
 
 az_cfg = load_azure_config_from_env()
 emb_cfg = load_embedding_config_from_env()
@@ -38,32 +55,68 @@ execution_settings.max_tokens = 256  # cap output to reduce latency
 
 retriever = VectorSearchRetriever(az_cfg)
 
+# Hedging / failover across deployments that share a pool
+deployment_router = DeploymentRouter()
+
 # Plugins
 kernel.add_plugin(plugin=VectorSearchPlugin(retriever), plugin_name="retrieval")
 
-async def rag_chat(db: Session, user_id: int, question: str, service_id: str) -> str:
-    model_cfg = _CACHED_MODEL_CONFIG.get(service_id) or load_model_cfg(db, service_id)
-    if not model_cfg:
-        raise ValueError(f"Chat service {service_id} not found in DB")
-    _CACHED_MODEL_CONFIG[service_id] = model_cfg
 
-    cache_key = service_id
+def _get_bundle(model_cfg: ModelConfig) -> ServiceBundle:
+    cache_key = model_cfg.service_id
 
-    bundle = _CACHED_CHAT_SERVICES.get(cache_key)
+    bundle = _CACHED_CHAT_SERVICES.get_local(cache_key)
     if bundle is None:
         chat_service = create_chat_service(model_cfg=model_cfg, azg_cfg=az_cfg)
-        kernel.add_service(chat_service)
+        # Rebuilt after eviction/invalidation, so replace any stale registration
+        kernel.add_service(chat_service, overwrite=True)
         bundle = ServiceBundle(chat_service=chat_service)
-        _CACHED_CHAT_SERVICES[cache_key] = bundle
+        _CACHED_CHAT_SERVICES.set_local(cache_key, bundle)
+    return bundle
+
+
+async def _pool_members(db: Session, model_cfg: ModelConfig) -> List[ModelConfig]:
+    if not model_cfg.pool:
+        return [model_cfg]
+    members = await _CACHED_POOLS.get(model_cfg.pool)
+    if not members:
+        members = load_pool_cfgs(db, model_cfg.pool)
+        await _CACHED_POOLS.set(model_cfg.pool, members)
+    return members or [model_cfg]
+
+
+async def invalidate_chat_service(service_id: str, pool: str | None = None) -> None:
+    await _CACHED_MODEL_CONFIG.invalidate(service_id)
+    await _CACHED_CHAT_SERVICES.invalidate(service_id)
+    if pool:
+        await _CACHED_POOLS.invalidate(pool)
+
+
+async def rag_chat(db: Session, user_id: int, question: str, service_id: str) -> str:
+    model_cfg = await _CACHED_MODEL_CONFIG.get(service_id)
+    if model_cfg is None:
+        model_cfg = load_model_cfg(db, service_id)
+        if not model_cfg:
+            raise ValueError(f"Chat service {service_id} not found in DB")
+        await _CACHED_MODEL_CONFIG.set(service_id, model_cfg)
+
+    deployments = {
+        cfg.service_id: _get_bundle(cfg).chat_service
+        for cfg in await _pool_members(db, model_cfg)
+    }
 
     history_store = ChatHistoryService()
     chat_history = await history_store.build_context(db=db, user_id=user_id, limit=8)
     chat_history.add_user_message(question)
 
-    answer = await bundle.chat_service.get_chat_message_content(
-        chat_history=chat_history,
-        settings=execution_settings,
-        kernel=kernel,
+    # Each attempt gets its own copy so hedged requests don't interleave tool calls
+    answer = await deployment_router.complete(
+        deployments,
+        lambda chat_service: chat_service.get_chat_message_content(
+            chat_history=chat_history.model_copy(deep=True),
+            settings=execution_settings,
+            kernel=kernel,
+        ),
     )
 
     answer_text = answer.content or (answer.items[0].text if answer.items else "")
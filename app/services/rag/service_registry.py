@@ -6,11 +6,21 @@ from app.models.model_config import ChatService
 from ...schemas.chat import ModelConfig
 
 
-def load_model_cfg(db: Session, service_id: str) -> ModelConfig | None:
-    svc = db.query(ChatService).filter_by(service_id=service_id).first()
-    if not svc:
-        return None
+def _to_model_cfg(svc: ChatService) -> ModelConfig:
     return ModelConfig(
         service_id=svc.service_id,
         chat_deployment=svc.chat_deployment,
+        pool=svc.pool,
     )
+
+
+def load_model_cfg(db: Session, service_id: str) -> ModelConfig | None:
+    svc = db.query(ChatService).filter_by(service_id=service_id).first()
+    if not svc:
+        return None
+    return _to_model_cfg(svc)
+
+
+def load_pool_cfgs(db: Session, pool: str) -> list[ModelConfig]:
+    rows = db.query(ChatService).filter_by(pool=pool).order_by(ChatService.id).all()
+    return [_to_model_cfg(svc) for svc in rows]
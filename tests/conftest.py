@@ -0,0 +1,10 @@
+import atexit
+import os
+import shutil
+import tempfile
+
+# Importing app.main creates tables and runs startup migrations, so point the
+# engine at a throwaway database before any app module is imported
+_DB_DIR = tempfile.mkdtemp(prefix="rag-chatbot-tests-")
+atexit.register(shutil.rmtree, _DB_DIR, ignore_errors=True)
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_DB_DIR, 'test.db')}"
@@ -0,0 +1,349 @@
+import asyncio
+import json
+
+import fakeredis
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.api.deps import get_current_user
+from app.core.cache import CacheBus, InMemoryStore, RedisStore, TwoTierCache, cache_bus
+from app.core.database import Base, get_db
+from app.main import app
+from app.models import History
+from app.schemas.chat import ModelConfig
+from app.services.rag import chat_history_service, factory
+from app.services.rag.chat_history_service import ChatHistoryService
+
+
+class RecordingStore(InMemoryStore):
+    def __init__(self):
+        super().__init__()
+        self.published = []
+
+    async def publish(self, channel, message):
+        self.published.append(message)
+        await super().publish(channel, message)
+
+
+class BrokenStore:
+    async def get(self, key):
+        raise ConnectionError("redis down")
+
+    set = delete = incr = publish = get
+
+    async def subscribe(self, channel, on_subscribed=None):
+        raise ConnectionError("redis down")
+        yield
+
+
+class FlakyStore(InMemoryStore):
+    """Drops the first subscription right after confirming it."""
+
+    def __init__(self):
+        super().__init__()
+        self.subscriptions = 0
+
+    async def subscribe(self, channel, on_subscribed=None):
+        self.subscriptions += 1
+        if self.subscriptions == 1:
+            on_subscribed()
+            raise ConnectionError("connection reset")
+        async for message in super().subscribe(channel, on_subscribed):
+            yield message
+
+
+def _in_memory_stores():
+    store = InMemoryStore()
+    return lambda: store
+
+
+def _fakeredis_stores():
+    server = fakeredis.FakeServer()
+    return lambda: RedisStore(
+        fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+    )
+
+
+@pytest.fixture(
+    params=[_in_memory_stores, _fakeredis_stores], ids=["memory", "fakeredis"]
+)
+def make_store(request):
+    return request.param()
+
+
+@pytest.fixture
+def session_factory():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture
+def app_store(monkeypatch):
+    """Points the app's global cache bus at a fresh recording store."""
+    store = RecordingStore()
+    monkeypatch.setattr(cache_bus, "store", store)
+    cache_bus.clear_local()
+    yield store
+    cache_bus.clear_local()
+
+
+async def _eventually(predicate):
+    for _ in range(100):
+        if predicate():
+            return True
+        await asyncio.sleep(0.01)
+    return False
+
+
+def test_invalidation_evicts_other_workers(make_store):
+    async def run():
+        a, b = CacheBus(make_store()), CacheBus(make_store())
+        cache_a, cache_b = TwoTierCache(a, "cfg"), TwoTierCache(b, "cfg")
+        await a.start()
+        await b.start()
+        try:
+            await cache_a.set("svc", {"deployment": "d1"})
+            # Cold worker is filled from the shared tier
+            assert await cache_b.get("svc") == {"deployment": "d1"}
+            assert cache_b.get_local("svc") == {"deployment": "d1"}
+
+            await cache_a.invalidate("svc")
+            assert await _eventually(lambda: cache_b.get_local("svc") is None)
+            assert await cache_b.get("svc") is None
+        finally:
+            await a.stop()
+            await b.stop()
+
+    asyncio.run(run())
+
+
+def test_worker_ignores_its_own_invalidations(make_store):
+    async def run():
+        a, b = CacheBus(make_store()), CacheBus(make_store())
+        cache_a, cache_b = TwoTierCache(a, "h"), TwoTierCache(b, "h")
+        await a.start()
+        await b.start()
+        try:
+            cache_a.set_local(1, "reducer-a")
+            cache_b.set_local(1, "reducer-b")
+            await cache_a.notify(1)
+            assert await _eventually(lambda: cache_b.get_local(1) is None)
+            assert cache_a.get_local(1) == "reducer-a"
+        finally:
+            await a.stop()
+            await b.stop()
+
+    asyncio.run(run())
+
+
+def test_resubscribe_clears_entries_cached_while_disconnected():
+    async def run():
+        store = FlakyStore()
+        bus = CacheBus(store, retry_delay_sec=0.05)
+        cache = TwoTierCache(bus, "cfg")
+        await bus.start()
+        try:
+            # Filled while the subscription is down; invalidations are missed
+            cache.set_local("svc", {"deployment": "stale"})
+            assert await _eventually(lambda: store.subscriptions == 2)
+            assert cache.get_local("svc") is None
+        finally:
+            await bus.stop()
+
+    asyncio.run(run())
+
+
+def test_local_only_cache_skips_shared_tier(make_store):
+    async def run():
+        bus = CacheBus(make_store())
+        cache = TwoTierCache(bus, "clients", shared=False)
+        client = object()
+        await cache.set("svc", client)
+        assert cache.get_local("svc") is client
+        assert await cache.get_shared("svc") is None
+
+    asyncio.run(run())
+
+
+def test_store_outage_degrades_to_misses():
+    async def run():
+        bus = CacheBus(BrokenStore(), subscribe_timeout_sec=0.05)
+        cache = TwoTierCache(bus, "cfg")
+        await bus.start()
+        try:
+            assert await cache.get("svc") is None
+            await cache.set("svc", {"deployment": "d1"})
+            assert cache.get_local("svc") == {"deployment": "d1"}
+            await cache.invalidate("svc")
+            assert cache.get_local("svc") is None
+            assert await cache.version("svc") is None
+            assert await cache.bump_version("svc") is None
+        finally:
+            await bus.stop()
+
+    asyncio.run(run())
+
+
+def test_persist_pair_keeps_local_and_evicts_other_worker(
+    app_store, session_factory, monkeypatch
+):
+    monkeypatch.setattr(chat_history_service, "SessionLocal", session_factory)
+
+    async def run():
+        other = CacheBus(app_store)
+        other_history = TwoTierCache(other, "history")
+        await cache_bus.start()
+        await other.start()
+        try:
+            svc = ChatHistoryService()
+            db = session_factory()
+            reducer = await svc.build_context(db=db, user_id=7)
+            db.close()
+            other_history.set_local(7, "other-worker-reducer")
+
+            await svc.persist_pair(7, "q1", "a1 token: abcdefghijkl")
+
+            # Our reducer is updated in place and stays cached
+            assert chat_history_service._CACHED_HISTORY.get_local(7) is reducer
+            assert reducer.messages[-1].content == "a1 token: ***REDACTED***"
+            assert await _eventually(lambda: other_history.get_local(7) is None)
+
+            # The pair was written through to the shared snapshot
+            entry = await chat_history_service._CACHED_HISTORY.get_shared(7)
+            assert entry == {
+                "version": 2,
+                "pairs": [["q1", "a1 token: ***REDACTED***"]],
+            }
+        finally:
+            await other.stop()
+            await cache_bus.stop()
+
+    asyncio.run(run())
+
+
+def test_history_read_racing_a_write_is_not_cached(app_store, session_factory):
+    history = chat_history_service._CACHED_HISTORY
+
+    class RacingSession:
+        """Another worker completes a write while our DB read is in flight."""
+
+        def __init__(self, session):
+            self._session = session
+
+        def query(self, *args):
+            writer = session_factory()
+            writer.add(History(user_id=3, question="q", answer="a"))
+            writer.commit()
+            writer.close()
+            app_store._data["rag:history:3:version"] = (None, "2")
+            return self._session.query(*args)
+
+    async def run():
+        svc = ChatHistoryService()
+        db = session_factory()
+        await svc.build_context(db=RacingSession(db), user_id=3)
+
+        assert history.get_local(3) is None
+        assert await history.get_shared(3) is None
+
+        reducer = await svc.build_context(db=db, user_id=3)
+        assert [m.content for m in reducer.messages[1:]] == ["q", "a"]
+        assert history.get_local(3) is reducer
+        assert (await history.get_shared(3))["version"] == 2
+        db.close()
+
+    asyncio.run(run())
+
+
+def test_history_read_between_commit_and_version_bump_is_not_cached(
+    app_store, session_factory, monkeypatch
+):
+    history = chat_history_service._CACHED_HISTORY
+    reads = []
+    loops = []
+
+    async def read_on_another_worker():
+        db = session_factory()
+        try:
+            reducer = await ChatHistoryService().build_context(db=db, user_id=5)
+            reads.append([m.content for m in reducer.messages[1:]])
+        finally:
+            db.close()
+
+    def committing_session():
+        session = session_factory()
+        commit = session.commit
+
+        def commit_then_read():
+            commit()
+            # DB already has the pair, but the writer hasn't bumped the version
+            future = asyncio.run_coroutine_threadsafe(read_on_another_worker(), loops[0])
+            future.result()
+            history.clear_local()  # the reader lives on another worker
+
+        session.commit = commit_then_read
+        return session
+
+    monkeypatch.setattr(chat_history_service, "SessionLocal", committing_session)
+
+    async def run():
+        loops.append(asyncio.get_running_loop())
+        db = session_factory()
+        # Warm the shared tier with the empty pre-write snapshot
+        await ChatHistoryService().build_context(db=db, user_id=5)
+        history.clear_local()
+
+        await ChatHistoryService().persist_pair(5, "q1", "a1")
+
+        assert reads == [["q1", "a1"]]
+        entry = await history.get_shared(5)
+        assert entry == {"version": 2, "pairs": [["q1", "a1"]]}
+        reducer = await ChatHistoryService().build_context(db=db, user_id=5)
+        assert [m.content for m in reducer.messages[1:]] == ["q1", "a1"]
+        db.close()
+
+    asyncio.run(run())
+
+
+def test_create_chat_service_invalidates_pool(app_store, session_factory):
+    other = CacheBus(app_store)
+    other_pools = TwoTierCache(other, "pool")
+    existing = ModelConfig(service_id="a", chat_deployment="dep-a", pool="p")
+    asyncio.run(factory._CACHED_POOLS.set("p", [existing]))
+    other_pools.set_local("p", [existing])
+
+    def _db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = _db
+    app.dependency_overrides[get_current_user] = lambda: None
+    try:
+        with TestClient(app) as client:
+            resp = client.post(
+                "/chat/service",
+                json={"service_id": "b", "chat_deployment": "dep-b", "pool": "p"},
+            )
+    finally:
+        app.dependency_overrides.clear()
+
+    assert resp.status_code == 200
+    assert factory._CACHED_POOLS.get_local("p") is None
+    assert asyncio.run(factory._CACHED_POOLS.get_shared("p")) is None
+
+    invalidated = {(m["ns"], m["key"]) for m in map(json.loads, app_store.published)}
+    assert {("pool", "p"), ("model_config", "b"), ("chat_service", "b")} <= invalidated
+
+    # Another worker receiving the broadcast drops its stale pool
+    for message in app_store.published:
+        other.handle(message)
+    assert other_pools.get_local("p") is None
@@ -0,0 +1,265 @@
+import asyncio
+import gc
+import random
+import time
+
+import httpx
+import pytest
+
+from app.services.rag.deployment_router import DeploymentRouter, is_retryable
+
+
+class FakeStatusError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class FakeDeployment:
+    """Chat deployment with an injected latency distribution."""
+
+    def __init__(self, name, latency, error=None):
+        self.name = name
+        self._latency = latency
+        self._error = error
+        self.calls = 0
+        self.cancelled = 0
+
+    async def complete(self):
+        self.calls += 1
+        delay = self._latency() if callable(self._latency) else self._latency
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self._error is not None:
+            raise self._error
+        return self.name
+
+
+class FirstRng:
+    """Always picks the first healthy deployment, in insertion order."""
+
+    def choices(self, population, weights):
+        return [population[0]]
+
+
+class Clock:
+    def __init__(self):
+        self.offset = 0.0
+
+    def __call__(self):
+        return time.monotonic() + self.offset
+
+
+def _call(dep):
+    return dep.complete()
+
+
+def _pool(*deps):
+    return {d.name: d for d in deps}
+
+
+async def _settle():
+    # Let cancelled losers run their cancellation handlers
+    await asyncio.sleep(0.01)
+
+
+def test_hedges_after_deadline_and_cancels_loser():
+    async def run():
+        router = DeploymentRouter(initial_deadline_sec=0.05, rng=FirstRng())
+        slow = FakeDeployment("slow", 1.0)
+        fast = FakeDeployment("fast", 0.01)
+
+        result = await router.complete(_pool(slow, fast), _call)
+
+        assert result == "fast"
+        assert (slow.calls, fast.calls) == (1, 1)
+        # The loser is cancelled and its elapsed time kept as a lower bound
+        # before complete() returns
+        assert slow.cancelled == 1
+        assert router.stats("slow").ewma >= 0.05
+        assert router.stats("fast").ewma < router.stats("slow").ewma
+
+    asyncio.run(run())
+
+
+def test_no_hedge_when_primary_is_within_deadline():
+    async def run():
+        router = DeploymentRouter(initial_deadline_sec=0.2, rng=FirstRng())
+        primary = FakeDeployment("primary", 0.01)
+        secondary = FakeDeployment("secondary", 0.01)
+
+        assert await router.complete(_pool(primary, secondary), _call) == "primary"
+        assert secondary.calls == 0
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        FakeStatusError(429),
+        FakeStatusError(503),
+        ConnectionError("reset"),
+        httpx.ConnectTimeout("timed out"),
+    ],
+)
+def test_fails_over_and_cools_down_throttled_deployment(error):
+    async def run():
+        clock = Clock()
+        router = DeploymentRouter(cooldown_sec=5.0, rng=FirstRng(), clock=clock)
+        throttled = FakeDeployment("throttled", 0.0, error=error)
+        healthy = FakeDeployment("healthy", 0.0)
+
+        assert await router.complete(_pool(throttled, healthy), _call) == "healthy"
+        assert router.order(["throttled", "healthy"]) == ["healthy", "throttled"]
+
+        clock.offset += 5.1
+        assert router.order(["throttled", "healthy"])[0] == "throttled"
+
+    asyncio.run(run())
+
+
+def test_fast_failures_do_not_make_a_throttled_deployment_preferred():
+    async def run():
+        clock = Clock()
+        router = DeploymentRouter(cooldown_sec=5.0, rng=FirstRng(), clock=clock)
+        throttled = FakeDeployment("throttled", 0.0, error=FakeStatusError(429))
+        healthy = FakeDeployment("healthy", 0.02)
+
+        for _ in range(3):
+            assert await router.complete(_pool(throttled, healthy), _call) == "healthy"
+            clock.offset += 5.1
+
+        assert router.stats("throttled").ewma is None
+        assert not router.stats("throttled").samples
+        # After its cooldown the throttled deployment is at best on par
+        router._rng = random.Random(0)
+        picks = [router.order(["throttled", "healthy"])[0] for _ in range(1000)]
+        assert picks.count("throttled") < 600
+
+    asyncio.run(run())
+
+
+def test_raises_last_error_when_every_deployment_fails():
+    async def run():
+        router = DeploymentRouter(rng=FirstRng())
+        a = FakeDeployment("a", 0.0, error=FakeStatusError(429))
+        b = FakeDeployment("b", 0.0, error=FakeStatusError(503))
+
+        with pytest.raises(FakeStatusError) as info:
+            await router.complete(_pool(a, b), _call)
+        assert info.value.status_code == 503
+
+    asyncio.run(run())
+
+
+def test_non_retryable_error_is_raised_without_failover():
+    async def run():
+        router = DeploymentRouter(rng=FirstRng())
+        bad = FakeDeployment("bad", 0.0, error=FakeStatusError(400))
+        other = FakeDeployment("other", 0.0)
+
+        with pytest.raises(FakeStatusError):
+            await router.complete(_pool(bad, other), _call)
+        assert other.calls == 0
+
+    asyncio.run(run())
+
+
+def test_non_retryable_hedge_error_waits_for_pending_primary():
+    async def run():
+        router = DeploymentRouter(initial_deadline_sec=0.01, rng=FirstRng())
+        primary = FakeDeployment("primary", 0.1)
+        hedge = FakeDeployment("hedge", 0.0, error=FakeStatusError(400))
+
+        assert await router.complete(_pool(primary, hedge), _call) == "primary"
+        assert hedge.calls == 1
+
+    asyncio.run(run())
+
+
+def test_failure_finishing_with_the_winner_is_retrieved():
+    class GatedDeployment(FakeDeployment):
+        def __init__(self, name, gate, error=None):
+            super().__init__(name, 0.0, error=error)
+            self._gate = gate
+
+        async def complete(self):
+            self.calls += 1
+            await self._gate.wait()
+            if self._error is not None:
+                raise self._error
+            return self.name
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        unhandled = []
+        loop.set_exception_handler(lambda _loop, ctx: unhandled.append(ctx))
+
+        gate = asyncio.Event()
+        router = DeploymentRouter(initial_deadline_sec=0.01, rng=FirstRng())
+        primary = GatedDeployment("primary", gate, error=FakeStatusError(503))
+        hedge = GatedDeployment("hedge", gate)
+        loop.call_later(0.05, gate.set)  # both finish in the same wakeup
+
+        assert await router.complete(_pool(primary, hedge), _call) == "hedge"
+        # The 503 was seen: primary is cooling down
+        assert router.order(["primary", "hedge"]) == ["hedge", "primary"]
+
+        del primary, hedge
+        gc.collect()
+        await asyncio.sleep(0)
+        assert not unhandled
+
+    asyncio.run(run())
+
+
+def test_ewma_weighting_prefers_fast_deployment():
+    async def run():
+        router = DeploymentRouter(
+            min_samples=4,
+            initial_deadline_sec=0.03,
+            min_deadline_sec=0.1,
+            rng=random.Random(7),
+        )
+        slow = FakeDeployment("slow", 0.3)
+        fast = FakeDeployment("fast", lambda: random.uniform(0.005, 0.015))
+
+        for _ in range(40):
+            assert await router.complete(_pool(slow, fast), _call) == "fast"
+            await _settle()
+
+        # Slow never wins, but its cancelled attempts still count against it
+        assert router.stats("slow").samples
+        assert router.stats("slow").ewma > 2.5 * router.stats("fast").ewma
+        picks = [router.order(["slow", "fast"])[0] for _ in range(1000)]
+        assert picks.count("fast") > 700
+        # Unweighted routing would make slow the primary on ~20 of 40 requests
+        assert slow.calls < 16
+
+    asyncio.run(run())
+
+
+def test_hedge_deadline_tracks_p95():
+    router = DeploymentRouter(
+        min_samples=4, initial_deadline_sec=2.0, min_deadline_sec=0.1
+    )
+    assert router.hedge_deadline("d") == 2.0
+    for latency in [0.2, 0.3, 0.4, 0.5, 0.6]:
+        router.stats("d").record(latency)
+    assert router.hedge_deadline("d") == 0.6
+
+
+def test_is_retryable_walks_cause_chain():
+    try:
+        try:
+            raise FakeStatusError(502)
+        except FakeStatusError as inner:
+            raise RuntimeError("wrapped") from inner
+    except RuntimeError as outer:
+        assert is_retryable(outer)
+    assert not is_retryable(FakeStatusError(404))
+    assert not is_retryable(ValueError("bad"))
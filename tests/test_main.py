@@ -0,0 +1,30 @@
+from sqlalchemy import create_engine, inspect, text
+
+import app.main as main
+
+
+def _columns(engine):
+    return {c["name"] for c in inspect(engine).get_columns("chat_services")}
+
+
+def test_migration_adds_pool_column_to_existing_database(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "CREATE TABLE chat_services ("
+                "id INTEGER PRIMARY KEY, "
+                "service_id VARCHAR NOT NULL UNIQUE, "
+                "chat_deployment VARCHAR NOT NULL)"
+            )
+        )
+        conn.execute(text("INSERT INTO chat_services VALUES (1, 'gpt', 'gpt-dep')"))
+    monkeypatch.setattr(main, "engine", engine)
+
+    main._migrate_chat_services_pool()
+    main._migrate_chat_services_pool()  # idempotent
+
+    assert "pool" in _columns(engine)
+    with engine.connect() as conn:
+        row = conn.execute(text("SELECT service_id, pool FROM chat_services")).one()
+    assert tuple(row) == ("gpt", None)